@@ -7,8 +7,10 @@ to the Verbum API WebSocket for real-time transcription using socket.io.
 """
 
 import asyncio
+import functools
 import json
 import logging
+import math
 import platform
 import signal
 import sys
@@ -17,16 +19,148 @@ import threading
 from typing import Optional
 import urllib.parse
 
+import janus
 import numpy as np
 import pyaudio
 import socketio
 from scipy import signal as scipy_signal
 
+try:
+    from numba import njit  # Optional: JIT-compiled audio kernel
+except ImportError:
+    njit = None
+
+try:
+    import orjson  # Optional: faster JSON formatting for event logs
+except ImportError:
+    orjson = None
+
+try:
+    # Optional: faster drop-in asyncio event loop
+    if platform.system() == "Windows":
+        import winloop as fast_event_loop
+    else:
+        import uvloop as fast_event_loop
+except ImportError:
+    fast_event_loop = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+def _format_json(data) -> str:
+    """Pretty-print data as JSON for logging, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(data, indent=2)
+
+
+def _build_mulaw_table() -> np.ndarray:
+    """G.711 mu-law code for every int16 sample, indexed by the sample's top 14 bits"""
+    idx = np.arange(1 << 14, dtype=np.int32)
+    samples = np.where(idx < (1 << 13), idx, idx - (1 << 14)) << 2
+    sign = np.where(samples < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(samples), 32635) + 0x84
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+
+
+# Encoding a chunk is then a single gather: _MULAW_TABLE[samples.view(np.uint16) >> 2]
+_MULAW_TABLE = _build_mulaw_table()
+
+
+@functools.lru_cache(maxsize=None)
+def _design_resample_taps(up: int, down: int) -> np.ndarray:
+    """Design the anti-aliasing FIR for resampling by up/down (same as scipy.signal.resample_poly)"""
+    max_rate = max(up, down)
+    taps = scipy_signal.firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=('kaiser', 5.0)) * up
+    taps.setflags(write=False)  # Shared through the cache
+    return taps
+
+
+@functools.lru_cache(maxsize=None)
+def _design_polyphase_taps(up: int, down: int) -> np.ndarray:
+    """Design Q15 anti-aliasing FIR taps split into `up` phases of equal length"""
+    if up == down:
+        phases = np.full((1, 1), 1 << 15, dtype=np.int32)
+    else:
+        taps = _design_resample_taps(up, down)
+        
+        # Pad to a multiple of `up` so phase p holds taps[p], taps[p + up], ...
+        taps = np.concatenate([taps, np.zeros(-len(taps) % up)])
+        phases = np.ascontiguousarray(np.rint(taps.reshape(-1, up).T * (1 << 15)), dtype=np.int32)
+    
+    phases.setflags(write=False)  # Shared through the cache
+    return phases
+
+
+def _resample_gain_kernel(in_i16, history, phase_state, taps, down, out_i16, gain_q15):
+    """Polyphase resample, boost and clip one int16 chunk into out_i16.
+    
+    `history` holds the last input samples of the previous chunk and
+    `phase_state[0]` the position of the next output sample, so consecutive
+    chunks are filtered as one continuous stream. Returns the number of
+    output samples written.
+    """
+    up = taps.shape[0]
+    num_taps = taps.shape[1]
+    hist_len = history.shape[0]
+    n_in = in_i16.shape[0]
+    
+    pos = phase_state[0]
+    end = n_in * up
+    n_out = 0
+    while pos < end:
+        n = pos // up
+        phase = pos - n * up
+        acc = np.int64(0)
+        if n >= num_taps - 1:
+            for j in range(num_taps):
+                acc += taps[phase, j] * np.int64(in_i16[n - j])
+        else:
+            for j in range(num_taps):
+                idx = n - j
+                if idx >= 0:
+                    acc += taps[phase, j] * np.int64(in_i16[idx])
+                else:
+                    acc += taps[phase, j] * np.int64(history[hist_len + idx])
+        
+        # Undo the Q15 tap scale, then apply the Q15 gain with rounding
+        sample = (acc + (1 << 14)) >> 15
+        sample = (sample * gain_q15 + (1 << 14)) >> 15
+        if sample > 32767:
+            sample = 32767
+        elif sample < -32768:
+            sample = -32768
+        out_i16[n_out] = sample
+        n_out += 1
+        pos += down
+    phase_state[0] = pos - end
+    
+    # Keep the tail of the stream for the next chunk
+    if n_in >= hist_len:
+        history[:] = in_i16[n_in - hist_len:]
+    else:
+        history[:hist_len - n_in] = history[n_in:]
+        history[hist_len - n_in:] = in_i16
+    
+    return n_out
+
+
+if njit is not None:
+    _resample_gain_kernel = njit(cache=True, fastmath=True)(_resample_gain_kernel)
+
+
+# Warm the design cache for the usual 44100 -> 8000 Hz (up=80, down=441) conversion
+# at import time, so stream setup just looks the taps up
+if njit is not None:
+    _design_polyphase_taps(80, 441)
+else:
+    _design_resample_taps(80, 441)
+
+
 class MicrophoneTranscriptionClient:
     """WebSocket client for real-time microphone transcription using Verbum API"""
     
@@ -36,23 +170,38 @@ class MicrophoneTranscriptionClient:
         self.is_recording = False
         self.audio_stream = None
         self.pyaudio_instance = None
+        self.input_device_index = None
         self.loop = None
-        self.audio_queue = asyncio.Queue()
+        self._tx_queue = None
+        self._pump_task = None
+        self._dropped_batches = 0
+        self._reported_drops = 0  # Drop count as of the last log line
+        self._last_drop_log = 0.0
         
         # Audio processing parameters
         self.sample_rate = 8000  # Target sample rate for Verbum API
         self.channels = 1  # Mono
         self.sample_width = 2  # 16-bit
-        self.chunk_size = config['streaming']['chunkSize']
+        # Bytes of outgoing audio to coalesce into one emit (0 sends every chunk)
+        emit_batch_ms = config['streaming'].get('emitBatchMs', 0)
+        self.emit_batch_bytes = int(self.sample_rate * emit_batch_ms / 1000) * self.sample_width
+        self.silence_threshold = config['streaming'].get('silenceThreshold', 0)
         self.input_sample_rate = 44100  # Most common microphone sample rate
+        # Rates to request from the device, cheapest to convert first: 8000 needs no
+        # resampling and 16000/48000 are integer multiples of the target rate
+        self.preferred_input_rates = [8000, 16000, 48000, 44100]
+        self.volume_gain = 1.1  # Light volume boost (similar to JS example)
+        self._gain_q15 = int(round(self.volume_gain * (1 << 15)))
         
-        # Windows-specific audio parameters
+        # One PyAudio callback per streaming interval
         self.is_windows = platform.system() == "Windows"
-        if self.is_windows:
-            # Windows often works better with smaller buffer sizes
-            self.frames_per_buffer = max(512, self.chunk_size // 4)
-        else:
-            self.frames_per_buffer = self.chunk_size // 2
+        self.frames_per_buffer = self._frames_for_rate(self.input_sample_rate)
+        self._in_count = self.frames_per_buffer  # Samples in every callback buffer
+        
+        # Preallocated buffers: per-chunk volume boost scratch and the outgoing batch
+        self._tx_fill = 0  # Samples batched in _out_buf_i16 and not yet sent
+        self._allocate_audio_buffers(self.frames_per_buffer)
+        self._configure_resampler()
         
         # Create Socket.IO client with proper configuration
         self.sio = socketio.AsyncClient(logger=False, engineio_logger=False)
@@ -60,6 +209,50 @@ class MicrophoneTranscriptionClient:
         # Setup event handlers
         self._setup_event_handlers()
     
+    @property
+    def config(self) -> dict:
+        """Client configuration; assign a new dict (or call refresh_connection_url()
+        after editing it in place) for STT option changes to apply on the next connect"""
+        return self._config
+    
+    @config.setter
+    def config(self, value: dict):
+        # The connection URL only depends on the config, so rebuild it when it's replaced
+        self._config = value
+        self.refresh_connection_url()
+    
+    def refresh_connection_url(self):
+        """Rebuild the cached connection URL after editing the config in place"""
+        self._connect_url, self._query_params = self._build_url()
+        # 'MULAW' sends 8-bit G.711 mu-law instead of 16-bit PCM, halving bytes on the wire.
+        # Derived here so the payload format always matches the encoding in the URL
+        self.mulaw = self._query_params.get('encoding') == 'MULAW'
+    
+    def _build_url(self) -> tuple:
+        """Build the /listen connection URL from the STT options (excluding auth token)"""
+        query_params = {}
+        stt_options = self.config.get('sttOptions', {})
+
+        for key, value in stt_options.items():
+            if isinstance(value, list):
+                # Convert list to a comma-separated string, like 'en-US,es-ES'
+                query_params[key] = ','.join(map(str, value))
+            elif key == 'tags' and isinstance(value, dict):
+                # In your TS code, you use JSON.stringify. The Python equivalent is json.dumps.
+                # We don't URL-encode it here; urlencode will handle it in the next step.
+                query_params[key] = json.dumps(value)
+            else:
+                # Convert all other values to their string representation
+                query_params[key] = str(value)
+        
+        # 2. Safely build the query string using urllib
+        # This handles special characters and formatting correctly.
+        query_string = urllib.parse.urlencode(query_params)
+        
+        # Connect to the server following JavaScript client pattern
+        server_url = f"{self.config['serverUrl']}/listen"
+        return f"{server_url}?{query_string}", query_params
+    
     def _setup_event_handlers(self):
         """Setup WebSocket event handlers"""
         
@@ -98,7 +291,11 @@ class MicrophoneTranscriptionClient:
         
         @self.sio.event(namespace='/listen')
         async def speechRecognized(data):
-            logger.info(f"\n📥 Received speechRecognized event: {json.dumps(data, indent=2)}")
+            # Fires for every interim result: keep per-event logging cheap and lazy
+            status = data.get('status')
+            logger.debug("speechRecognized status=%s len=%d", status, len(data.get('text') or ''))
+            if status == 'recognized' and logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"\n📥 Received speechRecognized event: {_format_json(data)}")
             self._handle_speech_result(data)
         
         # Add error event handler
@@ -156,34 +353,195 @@ class MicrophoneTranscriptionClient:
             
             print("─" * 60)
     
+    def _frames_for_rate(self, rate: int) -> int:
+        """Frames per buffer so the callback fires once every `intervalMs`"""
+        return max(1, int(rate * self.config['streaming']['intervalMs'] / 1000))
+    
+    def _allocate_audio_buffers(self, max_chunk_samples: int):
+        """Allocate reusable buffers so the audio callback does not allocate temporaries"""
+        self._boost_buf_i32 = np.empty(max_chunk_samples, dtype=np.int32)
+        batch_samples = self.emit_batch_bytes // self.sample_width
+        self._out_buf_i16 = np.empty(batch_samples + max_chunk_samples, dtype=np.int16)
+    
+    def _output_slot(self, n: int) -> np.ndarray:
+        """Room for n processed samples right after the audio already batched"""
+        end = self._tx_fill + n
+        if end > len(self._out_buf_i16):
+            grown = np.empty(end, dtype=np.int16)
+            grown[:self._tx_fill] = self._out_buf_i16[:self._tx_fill]
+            self._out_buf_i16 = grown
+        return self._out_buf_i16[self._tx_fill:end]
+    
+    def _configure_resampler(self):
+        """Cache the rational up/down factors for the current input sample rate"""
+        # e.g. 44100 -> 8000 Hz reduces to up=80, down=441
+        g = math.gcd(self.input_sample_rate, self.sample_rate)
+        self._resample_up = self.sample_rate // g
+        self._resample_down = self.input_sample_rate // g
+        self._in_phase = 0  # Input samples seen so far, modulo `down`
+        
+        if njit is None:
+            if self._resample_up == 1 and self._resample_down > 1:
+                # Integer ratio: streaming IIR anti-alias filter, then keep every down-th sample
+                self._decimate_sos = scipy_signal.cheby1(8, 0.05, 0.8 / self._resample_down, output='sos')
+                self._decimate_zi = np.zeros((self._decimate_sos.shape[0], 2))
+                self._decimate_phase = 0
+            elif self._resample_up != self._resample_down:
+                # Taps and streaming state for the scipy upfirdn path
+                self._resample_taps = _design_resample_taps(self._resample_up, self._resample_down)
+                self._resample_tail = np.zeros(0, dtype=np.int16)
+                self._resample_skip = 0
+        else:
+            # Fixed-ratio taps and streaming state for the JIT kernel
+            self._kernel_taps = _design_polyphase_taps(self._resample_up, self._resample_down)
+            self._kernel_history = np.zeros(self._kernel_taps.shape[1] - 1, dtype=np.int16)
+            self._kernel_phase = np.zeros(1, dtype=np.int64)
+            
+            # Compile (or load from cache) now rather than in the first audio callback.
+            # Warm up with a read-only bytes-backed array like the callback's frombuffer
+            # view, otherwise numba compiles a second specialization on the audio thread
+            self._run_kernel(np.frombuffer(bytes(2 * self.frames_per_buffer), dtype=np.int16))
+            self._kernel_history[:] = 0
+            self._kernel_phase[0] = 0
+    
+    def _silent_chunk(self, phase: int, n_in: int) -> np.ndarray:
+        """Write the zeros that n_in silent input samples resample to into the output buffer.
+        
+        `phase` is the input position (mod `down`) before the chunk. The
+        resampler state is reset to the position after it, as if it had just
+        filtered silence, so the next audible chunk lines up seamlessly.
+        """
+        up = self._resample_up
+        down = self._resample_down
+        after = (phase + n_in) % down
+        
+        # Outputs fall on every down-th sample of the up-sampled stream, so
+        # ceil(position * up / down) of them precede an input position
+        outputs_before = -(-phase * up // down)
+        outputs_after = -(-(phase + n_in) * up // down)
+        out = self._output_slot(outputs_after - outputs_before)
+        out[:] = 0
+        
+        next_output = -(-after * up // down)
+        if njit is not None:
+            self._kernel_history[:] = 0
+            self._kernel_phase[0] = next_output * down - after * up
+        elif up == 1 and down > 1:
+            self._decimate_zi[:] = 0
+            self._decimate_phase = -after % down
+        elif up != down:
+            self._resample_tail = np.zeros(after, dtype=np.int16)
+            self._resample_skip = next_output
+        return out
+    
+    def _run_kernel(self, audio_array: np.ndarray) -> np.ndarray:
+        """Resample and boost audio_array with the JIT kernel into the output buffer"""
+        max_out = len(audio_array) * self._resample_up // self._resample_down + 1
+        out = self._output_slot(max_out)
+        
+        n = _resample_gain_kernel(
+            audio_array,
+            self._kernel_history,
+            self._kernel_phase,
+            self._kernel_taps,
+            self._resample_down,
+            out,
+            self._gain_q15
+        )
+        return out[:n]
+    
     def _resample_audio(self, audio_data: np.ndarray, original_rate: int, target_rate: int) -> np.ndarray:
-        """Resample audio data from original_rate to target_rate"""
+        """Resample audio data from original_rate to target_rate.
+        
+        The filter runs over the tail of the previous chunk as well, so the
+        output is continuous across chunk boundaries instead of restarting
+        from silence on every chunk.
+        """
         if original_rate == target_rate:
             return audio_data
         
-        # Calculate resampling ratio
-        ratio = target_rate / original_rate
+        up = self._resample_up
+        down = self._resample_down
+        
+        if up == 1:
+            # Integer decimation, e.g. 48000 -> 8000: a low-order IIR is far cheaper than the FIR
+            filtered, self._decimate_zi = scipy_signal.sosfilt(self._decimate_sos, audio_data, zi=self._decimate_zi)
+            resampled_data = filtered[self._decimate_phase::down]
+            self._decimate_phase = (self._decimate_phase - len(audio_data)) % down
+            np.round(resampled_data, out=resampled_data)
+            np.clip(resampled_data, -32768, 32767, out=resampled_data)
+            return resampled_data.astype(np.int16, copy=False)
         
-        # Use scipy.signal.resample for high-quality resampling
-        resampled_length = int(len(audio_data) * ratio)
-        resampled_data = scipy_signal.resample(audio_data, resampled_length)
+        taps = self._resample_taps
         
-        return resampled_data.astype(np.int16)
+        # Polyphase FIR resampling: linear time and no FFT length pathologies.
+        # The tail starts on a multiple of `down` input samples, so upfirdn's
+        # output grid lines up with the stream's, and its first
+        # `_resample_skip` outputs were already returned last time.
+        x = np.concatenate((self._resample_tail, audio_data))
+        n_out = -(-len(x) * up // down)
+        resampled_data = scipy_signal.upfirdn(taps, x, up=up, down=down)[self._resample_skip:n_out]
+        
+        # Keep the input the next outputs still need, back to a multiple of `down`
+        keep_from = max(0, (n_out * down - len(taps) + 1) // up // down * down)
+        self._resample_tail = x[keep_from:]
+        self._resample_skip = n_out - keep_from // down * up
+        
+        # FIR overshoot on loud input must saturate, not wrap, when cast to int16
+        np.round(resampled_data, out=resampled_data)
+        np.clip(resampled_data, -32768, 32767, out=resampled_data)
+        return resampled_data.astype(np.int16, copy=False)
     
-    def _process_audio_chunk(self, raw_audio: bytes) -> bytes:
-        """Process raw audio chunk to match API requirements"""
-        # Convert bytes to numpy array (assuming 16-bit samples)
-        audio_array = np.frombuffer(raw_audio, dtype=np.int16)
+    def _process_audio_chunk(self, raw_audio: bytes) -> Optional[bytes]:
+        """Process raw audio chunk to match API requirements.
+        
+        Processed samples are appended to the outgoing batch buffer; returns
+        the batch as bytes once `emitBatchMs` of audio is ready, else None.
+        """
+        # Convert bytes to numpy array (assuming 16-bit samples, full buffers)
+        audio_array = np.frombuffer(raw_audio, dtype=np.int16, count=self._in_count)
+        
+        # Input position on the resampling grid, before and after this chunk
+        phase = self._in_phase
+        self._in_phase = (phase + len(audio_array)) % self._resample_down
         
-        # Resample if necessary
-        if self.input_sample_rate != self.sample_rate:
-            audio_array = self._resample_audio(audio_array, self.input_sample_rate, self.sample_rate)
+        # Silence gate: below the threshold, skip the DSP and send digital silence
+        peak = max(int(audio_array.max()), -int(audio_array.min()))
+        if peak < self.silence_threshold:
+            out = self._silent_chunk(phase, len(audio_array))
+        elif njit is not None:
+            # Single fused pass when numba is available
+            out = self._run_kernel(audio_array)
+        else:
+            # Resample if necessary
+            if self.input_sample_rate != self.sample_rate:
+                audio_array = self._resample_audio(audio_array, self.input_sample_rate, self.sample_rate)
+            
+            n = len(audio_array)
+            if n > len(self._boost_buf_i32):
+                self._boost_buf_i32 = np.empty(n, dtype=np.int32)
+            
+            # Apply light volume boost in place as Q15 fixed point, no float round trip
+            acc = self._boost_buf_i32[:n]
+            np.multiply(audio_array, np.int32(self._gain_q15), out=acc)
+            acc += 1 << 14
+            acc >>= 15
+            np.clip(acc, -32768, 32767, out=acc)
+            out = self._output_slot(n)
+            out[:] = acc
         
-        # Apply light volume boost (similar to JS example)
-        audio_array = np.clip(audio_array * 1.1, -32768, 32767).astype(np.int16)
+        self._tx_fill += len(out)
+        if self._tx_fill * self.sample_width < self.emit_batch_bytes:
+            return None
         
-        # Convert back to bytes
-        return audio_array.tobytes()
+        batch = self._out_buf_i16[:self._tx_fill]
+        if self.mulaw:
+            payload = _MULAW_TABLE[batch.view(np.uint16) >> 2].tobytes()
+        else:
+            # The only copy of the audio on its way out
+            payload = batch.tobytes()
+        self._tx_fill = 0
+        return payload
     
     def _find_best_microphone(self) -> Optional[int]:
         """Find the best available microphone device on Windows"""
@@ -194,7 +552,15 @@ class MicrophoneTranscriptionClient:
             # Get device count
             device_count = self.pyaudio_instance.get_device_count()
             
-            # Look for microphone devices
+            # On Windows prefer WASAPI endpoints, they support shorter periods than MME/DirectSound
+            wasapi_index = None
+            if self.is_windows:
+                try:
+                    wasapi_index = self.pyaudio_instance.get_host_api_info_by_type(pyaudio.paWASAPI)['index']
+                except Exception:
+                    pass
+            
+            # Pass 1: rank input devices by name and host API only (no format probing)
             microphone_devices = []
             
             for i in range(device_count):
@@ -214,33 +580,19 @@ class MicrophoneTranscriptionClient:
                         elif 'headset' in device_name or 'headphone' in device_name:
                             priority = 1
                         
-                        # Test if the device supports our target sample rates
-                        supported_rates = []
-                        test_rates = [44100, 48000, 16000, 8000]  # Common rates
-                        
-                        for rate in test_rates:
-                            try:
-                                # Test if this rate is supported
-                                if self.pyaudio_instance.is_format_supported(
-                                    rate=rate,
-                                    input_device=i,
-                                    input_channels=1,
-                                    input_format=pyaudio.paInt16
-                                ):
-                                    supported_rates.append(rate)
-                            except Exception:
-                                continue
+                        is_wasapi = device_info['hostApi'] == wasapi_index
+                        microphone_devices.append({
+                            'index': i,
+                            'name': device_info['name'],
+                            'priority': priority,
+                            'default_sample_rate': device_info['defaultSampleRate'],
+                            'channels': device_info['maxInputChannels'],
+                            'wasapi': is_wasapi
+                        })
                         
-                        # Only include devices that support at least one sample rate
-                        if supported_rates:
-                            microphone_devices.append({
-                                'index': i,
-                                'name': device_info['name'],
-                                'priority': priority,
-                                'default_sample_rate': device_info['defaultSampleRate'],
-                                'supported_rates': supported_rates,
-                                'channels': device_info['maxInputChannels']
-                            })
+                        # Nothing can outrank a Logitech device on the preferred host API
+                        if priority == 3 and (wasapi_index is None or is_wasapi):
+                            break
                         
                 except Exception as e:
                     # Skip devices that can't be queried
@@ -250,37 +602,33 @@ class MicrophoneTranscriptionClient:
                 logger.warning("No compatible microphone devices found, using default")
                 return None
             
-            # Sort by priority (highest first), then by whether they support 44100Hz
-            microphone_devices.sort(key=lambda x: (
-                x['priority'], 
-                44100 in x['supported_rates'],
-                len(x['supported_rates'])
-            ), reverse=True)
+            # Sort by priority (highest first), then host API
+            microphone_devices.sort(key=lambda x: (x['priority'], x['wasapi']), reverse=True)
             
             # Log available devices
             logger.info("Available microphone devices:")
             for device in microphone_devices[:5]:  # Show top 5
-                rates_str = ', '.join(str(r) for r in device['supported_rates'][:3])
-                if len(device['supported_rates']) > 3:
-                    rates_str += f", +{len(device['supported_rates'])-3} more"
-                    
                 logger.info(f"   {device['index']}: {device['name']} "
-                          f"(supported: {rates_str}Hz, {device['channels']} ch, priority: {device['priority']})")
+                          f"({device['channels']} ch, priority: {device['priority']})")
             
-            # Return the best device index
-            best_device = microphone_devices[0]
-            
-            # Update the input sample rate to the best supported rate
-            if 44100 in best_device['supported_rates']:
-                self.input_sample_rate = 44100
-            elif 48000 in best_device['supported_rates']:
-                self.input_sample_rate = 48000
-            elif best_device['supported_rates']:
-                self.input_sample_rate = int(best_device['supported_rates'][0])
-            
-            logger.info(f"Selected sample rate: {self.input_sample_rate}Hz for device {best_device['index']}")
+            # Pass 2: probe candidates in order, stopping at the first supported format
+            for device in microphone_devices:
+                for rate in self.preferred_input_rates:
+                    try:
+                        if self.pyaudio_instance.is_format_supported(
+                            rate=rate,
+                            input_device=device['index'],
+                            input_channels=1,
+                            input_format=pyaudio.paInt16
+                        ):
+                            self.input_sample_rate = rate
+                            logger.info(f"Selected sample rate: {self.input_sample_rate}Hz for device {device['index']}")
+                            return device['index']
+                    except Exception:
+                        continue
             
-            return best_device['index']
+            logger.warning("No compatible microphone devices found, using default")
+            return None
             
         except Exception as e:
             logger.warning(f"Error finding microphone devices: {e}")
@@ -288,32 +636,78 @@ class MicrophoneTranscriptionClient:
     
     def _audio_callback(self, in_data, frame_count, time_info, status):
         """PyAudio callback function for audio capture"""
+        if not (self.is_recording and self.is_connected):
+            return (None, pyaudio.paContinue)
+        
         if status:
             logger.warning(f"Audio callback status: {status}")
         
-        if self.is_recording and self.is_connected:
+        try:
+            # Process the audio chunk
+            processed_audio = self._process_audio_chunk(in_data)
+            
+            # Hand full batches to the pump task on the event loop thread
+            tx_queue = self._tx_queue
+            if processed_audio is not None and tx_queue is not None:
+                try:
+                    self._enqueue_audio(tx_queue, processed_audio)
+                except janus.SyncQueueShutDown:
+                    # Queue is closed, we are shutting down
+                    pass
+            
+        except Exception as e:
+            logger.error(f"Error processing audio chunk: {e}")
+        
+        return (None, pyaudio.paContinue)
+    
+    def _enqueue_audio(self, tx_queue: janus.Queue, payload: bytes):
+        """Queue a batch for sending, dropping the oldest one if the socket has fallen behind"""
+        # Called on the audio thread through the queue's synchronous side
+        sync_q = tx_queue.sync_q
+        try:
+            sync_q.put_nowait(payload)
+            return
+        except janus.SyncQueueFull:
+            pass
+        
+        try:
+            sync_q.get_nowait()
+        except janus.SyncQueueEmpty:
+            pass
+        self._dropped_batches += 1
+        
+        now = time.monotonic()
+        if now - self._last_drop_log >= 5.0:
+            logger.warning(f"⚠️  Network is behind, dropped {self._dropped_batches} audio batches so far")
+            self._reported_drops = self._dropped_batches
+            self._last_drop_log = now
+        
+        # This thread is the only producer, so there is room again
+        sync_q.put_nowait(payload)
+    
+    async def _pump_audio(self):
+        """Send queued audio batches to the server from the event loop"""
+        async_q = self._tx_queue.async_q
+        while self.is_recording:
+            chunk = await async_q.get()
+            
+            # Behind schedule: send everything already queued in a single emit
+            if not async_q.empty():
+                backlog = [chunk]
+                while not async_q.empty():
+                    backlog.append(async_q.get_nowait())
+                chunk = b''.join(backlog)
+            
             try:
-                # Process the audio chunk
-                processed_audio = self._process_audio_chunk(in_data)
-                
-                # On Windows, we need to handle the async call differently
-                if self.is_windows and self.loop:
-                    # Schedule the coroutine safely for Windows
-                    try:
-                        self.loop.call_soon_threadsafe(
-                            lambda: asyncio.create_task(self.sio.emit('audioStream', processed_audio, namespace='/listen'))
-                        )
-                    except RuntimeError:
-                        # Fallback if loop is not running
-                        pass
-                else:
-                    # For other platforms or if no loop reference
-                    asyncio.create_task(self.sio.emit('audioStream', processed_audio, namespace='/listen'))
-                
+                await self.sio.emit('audioStream', chunk, namespace='/listen')
             except Exception as e:
-                logger.error(f"Error processing audio chunk: {e}")
-        
-        return (in_data, pyaudio.paContinue)
+                logger.error(f"Error sending audio chunk: {e}")
+            
+            # The warning above only covers the start of a burst, report its full size once drained
+            dropped = self._dropped_batches
+            if dropped != self._reported_drops and async_q.empty():
+                logger.warning(f"⚠️  Network caught up, dropped {dropped} audio batches so far")
+                self._reported_drops = dropped
     
     async def connect(self):
         """Connect to the WebSocket server"""
@@ -322,30 +716,26 @@ class MicrophoneTranscriptionClient:
         # Store the current event loop for Windows compatibility
         self.loop = asyncio.get_running_loop()
         
+        if self.pyaudio_instance is None:
+            try:
+                # PortAudio's WASAPI backend ties its COM setup to the initializing thread, so
+                # PyAudio is created here and terminated in disconnect(), both on the loop thread
+                self.pyaudio_instance = pyaudio.PyAudio()
+                # Device enumeration is slow on some hosts, keep it off the event loop
+                self.input_device_index = await self.loop.run_in_executor(None, self._find_best_microphone)
+            except Exception as e:
+                logger.error(f"Failed to initialize audio input: {e}")
+                if self.is_windows:
+                    logger.error("Windows troubleshooting:")
+                    logger.error("- Ensure microphone permissions are granted")
+                    logger.error("- Check Windows Sound settings")
+                    logger.error("- Try running as administrator if needed")
+                raise
+        
         try:
-            # Build query parameters from STT options (excluding auth token)
-            query_params = {}
-            stt_options = self.config.get('sttOptions', {})
-
-            for key, value in stt_options.items():
-                if isinstance(value, list):
-                    # Convert list to a comma-separated string, like 'en-US,es-ES'
-                    query_params[key] = ','.join(map(str, value))
-                elif key == 'tags' and isinstance(value, dict):
-                    # In your TS code, you use JSON.stringify. The Python equivalent is json.dumps.
-                    # We don't URL-encode it here; urlencode will handle it in the next step.
-                    query_params[key] = json.dumps(value)
-                else:
-                    # Convert all other values to their string representation
-                    query_params[key] = str(value)
-            
-            # 2. Safely build the query string using urllib
-            # This handles special characters and formatting correctly.
-            query_string = urllib.parse.urlencode(query_params)
-            
-            # Connect to the server following JavaScript client pattern
             server_url = f"{self.config['serverUrl']}/listen"
-            full_url = f"{server_url}?{query_string}"
+            full_url = self._connect_url
+            query_params = self._query_params
             
             logger.info(f"🔧 Connecting to: {server_url}")
             logger.info(f"🔧 Full URL: {full_url}")
@@ -376,21 +766,31 @@ class MicrophoneTranscriptionClient:
         logger.info("🎤 Starting microphone recording...")
         logger.info(f"   Target format: {self.sample_rate}Hz, {self.channels} channel, 16-bit")
         logger.info(f"   Input format: {self.input_sample_rate}Hz (will be resampled)")
-        logger.info(f"   Chunk size: {self.chunk_size} bytes")
         logger.info(f"   Platform: {platform.system()}")
         
         try:
-            # Initialize PyAudio
-            self.pyaudio_instance = pyaudio.PyAudio()
-            
-            # Find the best microphone device
-            input_device_index = self._find_best_microphone()
+            # Initialize PyAudio and find the best microphone device, unless connect() already did
+            if self.pyaudio_instance is None:
+                self.pyaudio_instance = pyaudio.PyAudio()
+                self.input_device_index = self._find_best_microphone()
+            input_device_index = self.input_device_index
             
             # Get device info and log selection
+            host_api_stream_info = None
             if input_device_index is not None:
                 device_info = self.pyaudio_instance.get_device_info_by_index(input_device_index)
+                host_api = self.pyaudio_instance.get_host_api_info_by_index(device_info['hostApi'])
                 logger.info(f"   Using device: {device_info['name']} (Index: {input_device_index})")
                 logger.info(f"   Device sample rate: {self.input_sample_rate}Hz")
+                logger.info(f"   Host API: {host_api['name']}, "
+                            f"default low input latency: {device_info['defaultLowInputLatency'] * 1000:.1f}ms")
+                
+                # WASAPI shared mode with auto-convert, if this PyAudio build exposes it
+                wasapi_stream_info = getattr(pyaudio, 'PaWasapiStreamInfo', None)
+                auto_convert = getattr(pyaudio, 'paWinWasapiAutoConvert', None)
+                if (host_api['type'] == pyaudio.paWASAPI
+                        and wasapi_stream_info is not None and auto_convert is not None):
+                    host_api_stream_info = wasapi_stream_info(flags=auto_convert)
             else:
                 logger.info("   Using default input device")
                 logger.info(f"   Default sample rate: {self.input_sample_rate}Hz")
@@ -409,28 +809,49 @@ class MicrophoneTranscriptionClient:
             # Add device index if we found a specific one
             if input_device_index is not None:
                 stream_params['input_device_index'] = input_device_index
+            if host_api_stream_info is not None:
+                stream_params['input_host_api_specific_stream_info'] = host_api_stream_info
             
             # Try to open the audio stream with fallback sample rates
-            for attempt_rate in [self.input_sample_rate, 44100, 48000, 16000]:
+            attempt_rates = [self.input_sample_rate] + [
+                rate for rate in self.preferred_input_rates if rate != self.input_sample_rate
+            ]
+            for attempt_rate in attempt_rates:
                 try:
                     stream_params['rate'] = attempt_rate
+                    stream_params['frames_per_buffer'] = self._frames_for_rate(attempt_rate)
                     logger.info(f"   Attempting to open stream with {attempt_rate}Hz...")
                     self.audio_stream = self.pyaudio_instance.open(**stream_params)
                     if attempt_rate != self.input_sample_rate:
                         logger.info(f"   Successfully opened with fallback rate: {attempt_rate}Hz")
                         self.input_sample_rate = attempt_rate
+                    self.frames_per_buffer = stream_params['frames_per_buffer']
                     break
                 except Exception as e:
                     logger.warning(f"   Failed to open with {attempt_rate}Hz: {e}")
-                    if attempt_rate == 16000:  # Last attempt
+                    if attempt_rate == attempt_rates[-1]:  # Last attempt
                         raise e
                     continue
             
+            # Input rate is final now, refresh the resampling factors
+            self._configure_resampler()
+            self._tx_fill = 0
+            self._in_count = self.frames_per_buffer
+            self._dropped_batches = 0
+            self._reported_drops = 0
+            
+            # Single long-lived task drains the audio queue into the socket
+            # Bounded so a stalled socket drops old audio instead of accumulating latency
+            self._tx_queue = janus.Queue(maxsize=32)
+            
             # Start the stream
             self.audio_stream.start_stream()
             self.is_recording = True
+            self._pump_task = self.loop.create_task(self._pump_audio())
             
             logger.info("✅ Microphone recording started")
+            logger.info(f"   Buffer: {self.frames_per_buffer} frames, "
+                        f"input latency: {self.audio_stream.get_input_latency() * 1000:.1f}ms")
             logger.info("🎙️  Speak into your microphone...")
             
         except Exception as e:
@@ -456,9 +877,21 @@ class MicrophoneTranscriptionClient:
                 self.audio_stream.close()
                 self.audio_stream = None
             
-            if self.pyaudio_instance:
-                self.pyaudio_instance.terminate()
-                self.pyaudio_instance = None
+            if self._pump_task:
+                self._pump_task.cancel()
+                try:
+                    await self._pump_task
+                except asyncio.CancelledError:
+                    pass
+                self._pump_task = None
+            
+            if self._tx_queue:
+                self._tx_queue.close()
+                await self._tx_queue.wait_closed()
+                self._tx_queue = None
+            
+            if self._dropped_batches:
+                logger.warning(f"⚠️  Dropped {self._dropped_batches} audio batches in total while the network was behind")
             
             # Send stream end signal
             if self.is_connected:
@@ -476,6 +909,11 @@ class MicrophoneTranscriptionClient:
         
         await self.stop_recording()
         
+        # PyAudio is created in connect(), so release it even if recording never started
+        if self.pyaudio_instance:
+            self.pyaudio_instance.terminate()
+            self.pyaudio_instance = None
+        
         if self.is_connected:
             await self.sio.disconnect()
         
@@ -493,7 +931,7 @@ CONFIG = {
     # STT configuration parameters
     'sttOptions': {
         'language': 'es-MX',  # Language for the audio (changed to Spanish Mexico)
-        'encoding': 'PCM',  # Audio encoding format
+        'encoding': 'PCM',  # Audio encoding format: 'PCM' (16-bit) or 'MULAW' (8-bit G.711, half the bandwidth)
         'sampleRate': 8000,  # Sample rate (will match our processed audio)
         # 'profanityFilter': 'raw',  # Enable/disable profanity filtering: 'raw', 'masked', 'removed'
         # 'diarization': False,  # Enable/disable speaker diarization
@@ -506,8 +944,9 @@ CONFIG = {
     
     # Audio streaming configuration
     'streaming': {
-        'chunkSize': 1024,  # Audio chunk size in bytes
         'intervalMs': 20,  # Interval for audio processing
+        'emitBatchMs': 40,  # Audio to coalesce per socket emit (0 = send every chunk)
+        'silenceThreshold': 200,  # Peak level below which a chunk is sent as silence without processing (0 = off)
     },
 }
 
@@ -584,19 +1023,20 @@ if __name__ == "__main__":
     try:
         import pyaudio
         import socketio
+        import janus
         import numpy as np
         import scipy.signal
     except ImportError as e:
         print(f"❌ Missing required package: {e}")
         print("\n📦 Install required packages with:")
         if platform.system() == "Windows":
-            print("pip install pyaudio python-socketio numpy scipy")
+            print("pip install pyaudio python-socketio numpy scipy janus")
             print("\n🪟 Windows-specific notes:")
             print("- PyAudio should install automatically on Windows")
             print("- If PyAudio fails, try: pip install pipwin && pipwin install pyaudio")
             print("- Or download PyAudio wheel from: https://www.lfd.uci.edu/~gohlke/pythonlibs/#pyaudio")
         else:
-            print("pip install pyaudio python-socketio numpy scipy")
+            print("pip install pyaudio python-socketio numpy scipy janus")
         sys.exit(1)
     
     # Check PyAudio functionality on Windows
@@ -611,9 +1051,12 @@ if __name__ == "__main__":
             print(f"⚠️  Warning: PyAudio test failed: {e}")
             print("   This might indicate audio driver issues on Windows")
     
+    # Run on uvloop/winloop if installed; their run() replaces the deprecated install()
+    run = getattr(fast_event_loop, 'run', None) or asyncio.run
+    
     # Run the main function
     try:
-        asyncio.run(main())
+        run(main())
     except KeyboardInterrupt:
         print("\n👋 Goodbye!")
     except Exception as e: